@@ -0,0 +1,169 @@
+"""
+Бенчмарк lite-стриминга: старый разбор (aiter_lines + json.loads + json.dumps)
+против AnthropicStreamRelay на локальном фейковом SSE-сервере Anthropic.
+
+    python benchmarks/sse_relay_bench.py --concurrency 200 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse_relay import AnthropicStreamRelay  # noqa: E402
+
+
+def build_stream(deltas: int) -> bytes:
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+    parts = [
+        event("message_start", {
+            "type": "message_start",
+            "message": {"id": "msg_bench", "model": "claude-bench", "usage": {"input_tokens": 25, "output_tokens": 1}},
+        }),
+        event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+        event("ping", {"type": "ping"}),
+    ]
+    for i in range(deltas):
+        text = f"Волшебное слово {i} ✨ "
+        parts.append(event("content_block_delta", {
+            "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text},
+        }))
+    parts += [
+        event("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": deltas}}),
+        event("message_stop", {"type": "message_stop"}),
+    ]
+    return "".join(parts).encode("utf-8")
+
+
+async def start_fake_server(body: bytes, chunk_size: int):
+    """Минимальный HTTP/1.1 сервер с keep-alive, отдающий SSE чанками"""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: text/event-stream\r\n"
+                    b"Transfer-Encoding: chunked\r\n\r\n"
+                )
+                for i in range(0, len(body), chunk_size):
+                    part = body[i:i + chunk_size]
+                    writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+                    await writer.drain()
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def serve_forever(body: bytes, chunk_size: int, ports) -> None:
+    """Сервер работает в отдельном процессе, чтобы не делить CPU с клиентом"""
+
+    async def serve():
+        server, port = await start_fake_server(body, chunk_size)
+        ports.put(port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+async def legacy_stream(client, url, thread_id):
+    frames = 0
+    async with client.stream("POST", url, json={"stream": True}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                try:
+                    data = json.loads(line[6:])
+                except json.JSONDecodeError:
+                    continue
+                if data.get("type") == "content_block_delta":
+                    text = data.get("delta", {}).get("text", "")
+                    if text:
+                        _frame = json.dumps({"content": text, "thread_id": thread_id}, ensure_ascii=False)
+                        frames += 1
+    return frames
+
+
+async def relay_stream(client, url, thread_id):
+    frames = 0
+    relay = AnthropicStreamRelay()
+    suffix = f',"thread_id":{json.dumps(thread_id)}}}'
+    async with client.stream("POST", url, json={"stream": True}) as response:
+        async for chunk in response.aiter_bytes():
+            for text in relay.feed(chunk):
+                _frame = '{"content":' + text + suffix
+                frames += 1
+    return frames
+
+
+async def run(name, handler, url, args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(i):
+            async with semaphore:
+                return await handler(client, url, f"thread-{i}")
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        frames = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+    assert all(f == args.deltas for f in frames), f"{name}: unexpected frame count"
+    total = sum(frames)
+    print(
+        f"{name:>7}: {elapsed:6.2f}s wall, {cpu:6.2f}s cpu, "
+        f"{args.requests / elapsed:8.1f} req/s, {total / elapsed:10.0f} frames/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--deltas", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve_forever,
+        args=(build_stream(args.deltas), args.chunk_size, ports),
+        daemon=True
+    )
+    server.start()
+    url = f"http://127.0.0.1:{ports.get(timeout=10)}/v1/messages"
+    try:
+        await run("legacy", legacy_stream, url, args)
+        await run("relay", relay_stream, url, args)
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,430 @@
+import json
+import logging
+import os
+import uuid
+from enum import Enum
+from typing import Any, AsyncGenerator, Dict, Optional, Union
+
+from fastapi import APIRouter, FastAPI, HTTPException, Query
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, model_validator
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.middleware import SlowAPIMiddleware
+from slowapi.util import get_remote_address
+
+import hp_api
+import prefetch
+import tracing
+from sse_relay import AnthropicStreamRelay
+from sse_replay import ReplayBuffer, format_frame, parse_event_id
+from tracing import TracedMiddleware, TracingMiddleware, span
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_MESSAGES_URL = "https://api.anthropic.com/v1/messages"
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
+MAX_TOKENS = 5024
+
+limiter = Limiter(key_func=get_remote_address)
+
+HARRY_POTTER_SYSTEM_PROMPT = """
+🪄 Магический помощник мира Гарри Поттера
+Ты - всеведущий магический помощник, обладающий глубочайшими знаниями о волшебном мире! Ты можешь переключаться между режимами помощника и ролевой игры.
+🏰 Основные возможности:
+📚 Энциклопедические знания:
+
+Персонажи: Подробная информация о всех героях (дом, палочка, патронус, родословная, характер)
+Магия: Заклинания, зелья, артефакты, магические законы и теория
+Локации: Хогвартс, Диагон-аллея, Министерство магии, другие магические места
+История: События всех книг, хронология, скрытые детали
+Факультеты: Традиции, призраки, общие комнаты, известные выпускники
+Существа: От домовых эльфов до драконов, их поведение и магические свойства
+Квиддич: Правила, команды, знаменитые игроки, турниры
+
+🎭 Ролевая игра с персонажами:
+Команда: [Персонаж: Имя] - переключает в режим общения с персонажем
+
+Точно передаю личность, манеру речи и знания персонажа
+Реагирую согласно временному периоду (школьные годы, взрослая жизнь)
+Использую характерные выражения и особенности речи
+Отвечаю исходя из отношений персонажа с собеседником
+
+Примеры активации:
+
+[Персонаж: Гермиона Грейнджер] - стану Гермионой
+[Персонаж: Северус Снейп] - стану Снейпом
+[Помощник] - вернусь в режим помощника
+
+📋 Специальные функции:
+🃏 Карточка персонажа (команда: [Карточка: Имя])
+
+Полное имя и прозвища
+Дом в Хогвартсе / принадлежность
+Дата рождения и знак зодиака
+Магическая палочка (дерево, сердцевина, длина, особенности)
+Патронус и его значение
+Семья и родственные связи
+Ключевые черты характера
+Важнейшие достижения и события
+Любимые заклинания и способности
+Страхи и слабости
+Интересные факты
+
+🏠 Распределяющая шляпа (команда: [Распределение])
+Анализирую характер и определяю подходящий факультет с объяснением
+🔮 Предсказания (команда: [Гадание])
+В стиле профессора Трелони делаю "магические" предсказания
+⚗️ Мастер зелий (команда: [Зелье: название/эффект])
+Подробные рецепты зелий с ингредиентами и инструкциями
+🦌 Тест на патронуса (команда: [Патронус])
+Определяю патронуса на основе личности пользователя
+📖 Альтернативные сценарии (команда: [Что если...])
+Исследую альтернативные развития событий в мире ГП
+🎨 Стиль общения:
+В режиме помощника:
+
+Использую магическую терминологию
+Добавляю эмодзи и магические символы
+Отвечаю с энтузиазмом и знанием дела
+Делаю отсылки к событиям книг
+Говорю как истинный знаток волшебного мира
+
+В режиме персонажа:
+
+Полное погружение в роль
+Аутентичная речь и поведение
+Реакции согласно характеру персонажа
+Знания, соответствующие временному периоду
+Эмоциональные реакции, характерные для героя
+
+🌟 Дополнительные возможности:
+
+Квесты и загадки в стиле магического мира
+Создание новых заклинаний с логичными эффектами
+Анализ магических артефактов и их свойств
+Планирование магических уроков для разных курсов
+Создание магических существ с подробным описанием
+Генерация магических историй в стиле Дж.К. Роулинг
+Объяснение сложных магических теорий простым языком
+Помощь в создании магических ОС персонажей
+
+🔧 Команды управления:
+
+[Персонаж: Имя] - ролевая игра
+[Помощник] - обычный режим
+[Карточка: Имя] - подробная карточка
+[Распределение] - тест на факультет
+[Патронус] - определение патронуса
+[Зелье: название] - рецепт зелья
+[Гадание] - магическое предсказание
+[Что если...] - альтернативный сценарий
+"""
+
+
+class EngineMode(str, Enum):
+    LITE = "lite"    # прямой стриминг из Anthropic API, без графа и инструментов
+    AGENT = "agent"  # ReAct-агент LangGraph с инструментами и памятью диалога
+
+
+class SearchRequest(BaseModel):
+    search: str
+    thread_id: Optional[str] = None
+    mode: Optional[EngineMode] = None
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _trace_parsing(cls, data, handler):
+        with span("pydantic.SearchRequest", category="parsing"):
+            return handler(data)
+
+
+# Имена, по которым lite-режим подмешивает карточку персонажа; ключевые слова общие с prefetch
+CHARACTER_NAMES = [
+    "harry potter", "гарри поттер", "hermione", "гермиона", "ron", "рон",
+    "snape", "снейп", "dumbledore", "дамблдор"
+]
+
+
+async def add_character_context(search: str) -> str:
+    """Дополнить вопрос карточкой персонажа из HP API, если о нём спрашивают"""
+    search_lower = search.lower()
+    if not any(keyword in search_lower for keyword in prefetch.CHARACTER_KEYWORDS):
+        return search
+
+    for name in CHARACTER_NAMES:
+        if name in search_lower:
+            try:
+                found = await hp_api.find_characters(name)
+            except Exception as e:
+                logger.error(f"Error fetching character: {e}")
+                return search
+            if found:
+                search += f"\n\nДополнительная информация: {json.dumps(found[0], ensure_ascii=False)}"
+            break
+    return search
+
+
+class LiteEngine:
+    """Прямой стриминг ответа Claude через отдельный пул соединений; диалог не сохраняется"""
+
+    def __init__(self):
+        self.api_key = os.getenv("ANTHROPIC_API_KEY")
+
+    async def stream(
+        self,
+        search: str,
+        thread_id: str
+    ) -> AsyncGenerator[Union[Dict[str, Any], str], None]:
+        prompt = await add_character_context(search)
+
+        headers = {
+            "Content-Type": "application/json",
+            "X-API-Key": self.api_key,
+            "anthropic-version": "2023-06-01"
+        }
+        payload = {
+            "model": ANTHROPIC_MODEL,
+            "max_tokens": MAX_TOKENS,
+            "system": HARRY_POTTER_SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+
+        relay = AnthropicStreamRelay()
+        # Текст дельты уже является JSON-литералом, остальное кадра сериализуем один раз
+        frame_prefix = '{"content":'
+        frame_suffix = f',"thread_id":{json.dumps(thread_id, ensure_ascii=False)}}}'
+
+        with span("lite.anthropic_stream", category="llm"):
+            async with hp_api.get_anthropic_client().stream(
+                "POST",
+                ANTHROPIC_MESSAGES_URL,
+                headers=headers,
+                json=payload
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    for text in relay.feed(chunk):
+                        yield frame_prefix + text + frame_suffix
+
+        yield {
+            "type": "usage",
+            "model": relay.model,
+            "stop_reason": relay.stop_reason,
+            "usage": relay.usage,
+            "thread_id": thread_id,
+        }
+
+
+class AgentEngine:
+    """
+    ReAct-агент с инструментами HP API. LangGraph импортируется лениво,
+    чтобы lite-развёртывания не платили за него временем старта.
+    """
+
+    def __init__(self):
+        self._agent = None
+
+    def build(self):
+        if self._agent is not None:
+            return self._agent
+
+        from langchain_anthropic import ChatAnthropic
+        from langgraph.checkpoint.memory import MemorySaver
+        from langgraph.prebuilt import create_react_agent
+        from character_simulation import CHARACTER_SIMULATION_TOOLS
+        from hp_tools import HP_TOOLS
+
+        model = ChatAnthropic(
+            model=ANTHROPIC_MODEL,
+            betas=["extended-cache-ttl-2025-04-11", "code-execution-2025-05-22",
+                   "fine-grained-tool-streaming-2025-05-14",
+                   "token-efficient-tools-2025-02-19"],
+            max_tokens=MAX_TOKENS,
+            max_retries=2,
+            timeout=None,
+        )
+
+        # Подключаем Harry Potter API tools + симуляция персонажей
+        tools = HP_TOOLS + CHARACTER_SIMULATION_TOOLS
+
+        self._agent = create_react_agent(
+            model.bind(system=HARRY_POTTER_SYSTEM_PROMPT),
+            tools,
+            checkpointer=MemorySaver()
+        )
+        logger.info("Harry Potter agent initialized successfully")
+        return self._agent
+
+    def _config(self, thread_id: str) -> Dict[str, Any]:
+        return {
+            "configurable": {"thread_id": thread_id},
+            "callbacks": tracing.langchain_callbacks(),
+        }
+
+    async def stream(self, search: str, thread_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        from langchain_core.messages import HumanMessage
+
+        # Данные HP API греются параллельно с первым вызовом модели
+        async with prefetch.speculate(search):
+            # Простое сообщение пользователя - контекст сохранится через checkpointer
+            async for chunk, _ in self.build().astream(
+                {"messages": [HumanMessage(content=search)]},
+                config=self._config(thread_id),
+                stream_mode="messages",
+                version="v1"
+            ):
+                yield {"content": chunk.content, "thread_id": thread_id}
+
+    async def invoke(self, search: str, thread_id: str) -> str:
+        from langchain_core.messages import HumanMessage
+
+        async with prefetch.speculate(search):
+            response = await self.build().ainvoke(
+                {"messages": [HumanMessage(content=search)]},
+                config=self._config(thread_id)
+            )
+        return response["messages"][-1].content
+
+
+class Engine:
+    """
+    Общий конвейер для main.py и simple_main.py: выбор режима,
+    фоновая генерация с буфером докачки, трейсинг и формат SSE-событий.
+    """
+
+    def __init__(self, default_mode: str = "agent"):
+        self.default_mode = EngineMode(default_mode)
+        self.lite = LiteEngine()
+        self.agent = AgentEngine()
+        # Буфер отправленных SSE-событий для докачки ответа по Last-Event-ID
+        self.replay_buffer = ReplayBuffer(
+            max_events=int(os.getenv("SSE_REPLAY_MAX_EVENTS", "2000")),
+            ttl=float(os.getenv("SSE_REPLAY_TTL", "300")),
+            max_sessions=int(os.getenv("SSE_REPLAY_MAX_SESSIONS", "1000")),
+        )
+
+    def warmup(self) -> None:
+        if self.default_mode == EngineMode.AGENT:
+            self.agent.build()
+
+    async def aclose(self) -> None:
+        await hp_api.aclose()
+
+    async def run(
+        self,
+        search: str,
+        thread_id: str,
+        mode: EngineMode
+    ) -> AsyncGenerator[Union[Dict[str, Any], str], None]:
+        runner = self.agent if mode == EngineMode.AGENT else self.lite
+        try:
+            async for data in runner.stream(search, thread_id):
+                yield data
+            yield {"type": "done", "thread_id": thread_id}
+        except Exception as e:
+            logger.error(f"Error generating magical response ({mode.value}): {e}")
+            yield {
+                "error": "Произошла магическая ошибка",
+                "type": "error"
+            }
+
+    async def generate(
+        self,
+        search: str,
+        thread_id: Optional[str],
+        mode: Optional[EngineMode] = None,
+        last_event_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        # Переподключение: докачиваем из буфера или подключаемся к идущей генерации.
+        # Новый запуск агента здесь не делаем - он повторно добавил бы вопрос в историю
+        if last_event_id:
+            parsed = parse_event_id(last_event_id)
+            session = self.replay_buffer.get(parsed[1]) if parsed else None
+            if session is None or session.thread_id != parsed[0]:
+                logger.info(f"Replay expired for event {last_event_id}")
+                yield format_frame({
+                    "type": "expired",
+                    "thread_id": parsed[0] if parsed else thread_id,
+                    "error": "Ответ больше недоступен, отправьте вопрос заново",
+                })
+                return
+
+            logger.info(f"Resuming stream for thread {session.thread_id} after event {parsed[2]}")
+            async for frame in session.subscribe(parsed[2]):
+                yield frame
+            return
+
+        # Генерируем новый thread_id если не передан или null
+        if not thread_id or thread_id == "null":
+            thread_id = str(uuid.uuid4())
+
+        # Генерация идёт в фоне, поэтому обрыв соединения её не прерывает
+        mode = mode or self.default_mode
+        session = self.replay_buffer.start(thread_id, self.run(search, thread_id, mode))
+        async for frame in session.subscribe():
+            yield frame
+
+    def stream_response(
+        self,
+        search_request: SearchRequest,
+        last_event_id: Optional[str] = None
+    ) -> StreamingResponse:
+        return StreamingResponse(
+            self.generate(
+                search_request.search,
+                search_request.thread_id,
+                search_request.mode,
+                last_event_id
+            ),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no"
+            }
+        )
+
+
+debug_router = APIRouter(prefix="/debug")
+
+
+@debug_router.post("/profile")
+async def debug_profile(
+    seconds: float = Query(10.0, gt=0, le=120),
+    limit: int = Query(50, gt=0, le=500)
+):
+    """Снять CPU-профиль воркера (только в режиме DEBUG)"""
+    try:
+        report = await tracing.profile_cpu(seconds, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PlainTextResponse(report)
+
+
+def setup_app(app: FastAPI, debug: bool = False) -> None:
+    """
+    Rate limiting, CORS и трейсинг, общие для обоих приложений.
+    Отладочные эндпоинты подключаются только при debug=True (DEBUG=true).
+    """
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_middleware(TracedMiddleware, middleware=SlowAPIMiddleware, name="middleware.slowapi")
+    app.add_middleware(
+        TracedMiddleware,
+        middleware=CORSMiddleware,
+        name="middleware.cors",
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Корневой спан запроса, должен быть самым внешним middleware
+    app.add_middleware(TracingMiddleware)
+    if debug:
+        app.include_router(debug_router)
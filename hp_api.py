@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HP_API_BASE_URL = "https://hp-api.onrender.com/api"
+
+# Данные HP API практически статичны, поэтому кэшируем ответы целиком
+HP_API_CACHE_TTL = float(os.getenv("HP_API_CACHE_TTL", "3600"))
+
+# Конечный read-таймаут обрывает зависший upstream-стрим, pool-таймаут не даёт
+# запросам бесконечно ждать свободного соединения
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=10.0, pool=10.0)
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "100"))
+
+_client: Optional[httpx.AsyncClient] = None
+_anthropic_client: Optional[httpx.AsyncClient] = None
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Журнал запросов в рамках текущего запуска агента (для метрик prefetch):
+# пары (путь, источник), где источник - "cache", "inflight" или "network"
+fetch_log: ContextVar[Optional[List[Tuple[str, str]]]] = ContextVar("hp_api_fetch_log", default=None)
+
+# LRU-кэш ответов: модель может выдумывать id персонажей, поэтому размер ограничен
+HP_API_CACHE_MAX_ENTRIES = int(os.getenv("HP_API_CACHE_MAX_ENTRIES", "256"))
+_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+_MISSING = object()
+
+
+def _cache_get(path: str) -> Any:
+    cached = _cache.get(path)
+    if cached is None:
+        return _MISSING
+    if time.monotonic() - cached[0] >= HP_API_CACHE_TTL:
+        del _cache[path]
+        return _MISSING
+    _cache.move_to_end(path)
+    return cached[1]
+
+
+def _cache_put(path: str, data: Any) -> None:
+    _cache[path] = (time.monotonic(), data)
+    _cache.move_to_end(path)
+    while len(_cache) > HP_API_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий HTTP-клиент с пулом соединений для HP API"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+def get_anthropic_client() -> httpx.AsyncClient:
+    """
+    Отдельный пул для долгих стримов Anthropic API,
+    чтобы они не занимали соединения инструментов HP API.
+    """
+    global _anthropic_client
+    if _anthropic_client is None or _anthropic_client.is_closed:
+        _anthropic_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                max_keepalive_connections=20
+            ),
+        )
+    return _anthropic_client
+
+
+async def aclose() -> None:
+    global _client, _anthropic_client
+    for client in (_client, _anthropic_client):
+        if client is not None and not client.is_closed:
+            await client.aclose()
+    _client = None
+    _anthropic_client = None
+
+
+async def _fetch(path: str) -> Any:
+    response = await get_http_client().get(f"{HP_API_BASE_URL}{path}")
+    response.raise_for_status()
+    data = response.json()
+    _cache_put(path, data)
+    return data
+
+
+def _forget_inflight(path: str, task: asyncio.Task) -> None:
+    if _inflight.get(path) is task:
+        del _inflight[path]
+    # Ошибку уже получили ожидающие; помечаем её прочитанной, если их не осталось
+    if not task.cancelled():
+        task.exception()
+
+
+async def get_json(path: str) -> Any:
+    """
+    GET-запрос к HP API с TTL-кэшем.
+    Одновременные запросы одного и того же пути ждут единственный вызов.
+    Запрос идёт в отдельной задаче: отмена одного из ожидающих, включая
+    начавшего запрос, не прерывает его для остальных.
+    """
+    log = fetch_log.get()
+
+    data = _cache_get(path)
+    if data is not _MISSING:
+        if log is not None:
+            log.append((path, "cache"))
+        return data
+
+    task = _inflight.get(path)
+    if task is not None:
+        if log is not None:
+            log.append((path, "inflight"))
+    else:
+        if log is not None:
+            log.append((path, "network"))
+        task = asyncio.create_task(_fetch(path))
+        _inflight[path] = task
+        task.add_done_callback(lambda done: _forget_inflight(path, done))
+
+    return await asyncio.shield(task)
+
+
+def match_characters(characters: List[Dict[str, Any]], name: str) -> List[Dict[str, Any]]:
+    """Поиск по имени и альтернативным именам (нечувствительный к регистру)"""
+    name = name.lower()
+    return [
+        char for char in characters
+        if name in char.get('name', '').lower() or
+        any(name in alt_name.lower() for alt_name in char.get('alternate_names', []))
+    ]
+
+
+async def find_characters(name: str) -> List[Dict[str, Any]]:
+    return match_characters(await get_json("/characters"), name)
@@ -1,13 +1,11 @@
-import httpx
 import logging
 from typing import List, Dict, Any, Optional
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
+from hp_api import get_json, match_characters
 
 logger = logging.getLogger(__name__)
 
-HP_API_BASE_URL = "https://hp-api.onrender.com/api"
-
 class Character(BaseModel):
     id: str
     name: str
@@ -42,12 +40,9 @@ async def get_all_characters() -> List[Dict[str, Any]]:
     Возвращает полный список персонажей с их характеристиками.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/characters")
-            response.raise_for_status()
-            characters = response.json()
-            logger.info(f"Получено {len(characters)} персонажей")
-            return characters
+        characters = await get_json("/characters")
+        logger.info(f"Получено {len(characters)} персонажей")
+        return characters
     except Exception as e:
         logger.error(f"Ошибка получения персонажей: {e}")
         return {"error": f"Не удалось получить персонажей: {str(e)}"}
@@ -61,14 +56,11 @@ async def get_character_by_id(character_id: str) -> Dict[str, Any]:
         character_id: Уникальный идентификатор персонажа
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/character/{character_id}")
-            response.raise_for_status()
-            character_data = response.json()
-            if character_data:
-                logger.info(f"Получен персонаж: {character_data[0].get('name', 'Unknown')}")
-                return character_data[0]
-            return {"error": "Персонаж не найден"}
+        character_data = await get_json(f"/character/{character_id}")
+        if character_data:
+            logger.info(f"Получен персонаж: {character_data[0].get('name', 'Unknown')}")
+            return character_data[0]
+        return {"error": "Персонаж не найден"}
     except Exception as e:
         logger.error(f"Ошибка получения персонажа {character_id}: {e}")
         return {"error": f"Не удалось получить персонажа: {str(e)}"}
@@ -80,12 +72,9 @@ async def get_hogwarts_students() -> List[Dict[str, Any]]:
     Возвращает информацию о студентах, которые учились в школе чародейства и волшебства.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/characters/students")
-            response.raise_for_status()
-            students = response.json()
-            logger.info(f"Получено {len(students)} учеников Хогвартса")
-            return students
+        students = await get_json("/characters/students")
+        logger.info(f"Получено {len(students)} учеников Хогвартса")
+        return students
     except Exception as e:
         logger.error(f"Ошибка получения учеников: {e}")
         return {"error": f"Не удалось получить учеников: {str(e)}"}
@@ -97,12 +86,9 @@ async def get_hogwarts_staff() -> List[Dict[str, Any]]:
     Возвращает информацию о преподавателях и персонале школы.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/characters/staff")
-            response.raise_for_status()
-            staff = response.json()
-            logger.info(f"Получено {len(staff)} сотрудников Хогвартса")
-            return staff
+        staff = await get_json("/characters/staff")
+        logger.info(f"Получено {len(staff)} сотрудников Хогвартса")
+        return staff
     except Exception as e:
         logger.error(f"Ошибка получения сотрудников: {e}")
         return {"error": f"Не удалось получить сотрудников: {str(e)}"}
@@ -122,12 +108,9 @@ async def get_characters_by_house(house: str) -> List[Dict[str, Any]]:
         return {"error": f"Неверный факультет. Допустимые значения: {', '.join(valid_houses)}"}
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/characters/house/{house_lower}")
-            response.raise_for_status()
-            house_members = response.json()
-            logger.info(f"Получено {len(house_members)} персонажей из {house.capitalize()}")
-            return house_members
+        house_members = await get_json(f"/characters/house/{house_lower}")
+        logger.info(f"Получено {len(house_members)} персонажей из {house.capitalize()}")
+        return house_members
     except Exception as e:
         logger.error(f"Ошибка получения персонажей факультета {house}: {e}")
         return {"error": f"Не удалось получить персонажей факультета: {str(e)}"}
@@ -139,12 +122,9 @@ async def get_all_spells() -> List[Dict[str, Any]]:
     Возвращает заклинания с их названиями и описаниями.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/spells")
-            response.raise_for_status()
-            spells = response.json()
-            logger.info(f"Получено {len(spells)} заклинаний")
-            return spells
+        spells = await get_json("/spells")
+        logger.info(f"Получено {len(spells)} заклинаний")
+        return spells
     except Exception as e:
         logger.error(f"Ошибка получения заклинаний: {e}")
         return {"error": f"Не удалось получить заклинания: {str(e)}"}
@@ -159,21 +139,14 @@ async def search_character_by_name(name: str) -> List[Dict[str, Any]]:
     """
     try:
         # Получаем всех персонажей и фильтруем по имени
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/characters")
-            response.raise_for_status()
-            all_characters = response.json()
-            
-            # Поиск по имени (нечувствительный к регистру)
-            found_characters = [
-                char for char in all_characters 
-                if name.lower() in char.get('name', '').lower() or
-                any(name.lower() in alt_name.lower() for alt_name in char.get('alternate_names', []))
-            ]
-            
-            logger.info(f"Найдено {len(found_characters)} персонажей по запросу '{name}'")
-            return found_characters
-            
+        all_characters = await get_json("/characters")
+        
+        # Поиск по имени (нечувствительный к регистру)
+        found_characters = match_characters(all_characters, name)
+        
+        logger.info(f"Найдено {len(found_characters)} персонажей по запросу '{name}'")
+        return found_characters
+        
     except Exception as e:
         logger.error(f"Ошибка поиска персонажа {name}: {e}")
         return {"error": f"Не удалось найти персонажа: {str(e)}"}
@@ -187,21 +160,18 @@ async def search_spells_by_name(name: str) -> List[Dict[str, Any]]:
         name: Название заклинания для поиска
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{HP_API_BASE_URL}/spells")
-            response.raise_for_status()
-            all_spells = response.json()
-            
-            # Поиск по названию или описанию (нечувствительный к регистру)
-            found_spells = [
-                spell for spell in all_spells 
-                if name.lower() in spell.get('name', '').lower() or
-                name.lower() in spell.get('description', '').lower()
-            ]
-            
-            logger.info(f"Найдено {len(found_spells)} заклинаний по запросу '{name}'")
-            return found_spells
-            
+        all_spells = await get_json("/spells")
+        
+        # Поиск по названию или описанию (нечувствительный к регистру)
+        found_spells = [
+            spell for spell in all_spells 
+            if name.lower() in spell.get('name', '').lower() or
+            name.lower() in spell.get('description', '').lower()
+        ]
+        
+        logger.info(f"Найдено {len(found_spells)} заклинаний по запросу '{name}'")
+        return found_spells
+        
     except Exception as e:
         logger.error(f"Ошибка поиска заклинания {name}: {e}")
         return {"error": f"Не удалось найти заклинание: {str(e)}"}
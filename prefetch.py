@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Pattern, Tuple
+
+import hp_api
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+
+# Основы слов, чтобы совпадали русские падежи: "Гриффиндора", "Слизерину"
+HOUSES = {
+    "gryffindor": ["gryffindor", "гриффиндор"],
+    "slytherin": ["slytherin", "слизерин"],
+    "ravenclaw": ["ravenclaw", "когтевран"],
+    "hufflepuff": ["hufflepuff", "пуффендуй"],
+}
+
+CHARACTER_KEYWORDS = ["персонаж", "character", "герой", "информация о"]
+CHARACTER_NAMES = [
+    "harry potter", "гарри поттер", "hermione", "гермион", "ron", "рон",
+    "snape", "снейп", "dumbledore", "дамблдор", "voldemort", "волдеморт",
+    "draco", "драко", "malfoy", "малфо", "hagrid", "хагрид",
+    "sirius", "сириус", "lupin", "люпин", "neville", "невилл",
+    "luna", "лун", "ginny", "джинни", "mcgonagall", "макгонагалл",
+    "bellatrix", "беллатрис", "dobby", "добби", "weasley", "уизли"
+]
+
+SPELL_KEYWORDS = [
+    "spell", "заклинани", "чары", "expelliarmus", "экспеллиармус",
+    "avada kedavra", "авада кедавра", "expecto patronum", "экспекто патронум",
+    "lumos", "люмос", "wingardium", "вингардиум", "alohomora", "алохомора",
+    "accio", "акцио", "crucio", "круцио", "imperio", "империо",
+    "obliviate", "обливиэйт", "stupefy", "остолбеней"
+]
+
+STUDENT_KEYWORDS = ["student", "студент", "ученик", "ученицы"]
+STAFF_KEYWORDS = ["staff", "professor", "teacher", "преподавател", "профессор", "учител"]
+
+
+def _compile(keywords: Iterable[str], whole_latin_words: bool = False) -> Pattern[str]:
+    """
+    Одна регулярка на список ключевых слов: совпадение только с начала слова,
+    чтобы "рон" не находился в "сторона", а "ron" в "iron".
+    Латинские имена с whole_latin_words ищутся целым словом ("ron", но не "strongest"),
+    русские основы - как префикс слова, чтобы совпадали падежи ("Рона", "Луну").
+    """
+    alternatives = []
+    for keyword in sorted(keywords, key=len, reverse=True):
+        pattern = re.escape(keyword)
+        if whole_latin_words and keyword.isascii():
+            pattern += r"\b"
+        alternatives.append(pattern)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + ")")
+
+
+HOUSE_PATTERNS = {house: _compile(names) for house, names in HOUSES.items()}
+CHARACTER_PATTERN = _compile(CHARACTER_KEYWORDS)
+CHARACTER_NAME_PATTERN = _compile(CHARACTER_NAMES, whole_latin_words=True)
+SPELL_PATTERN = _compile(SPELL_KEYWORDS)
+STUDENT_PATTERN = _compile(STUDENT_KEYWORDS)
+STAFF_PATTERN = _compile(STAFF_KEYWORDS)
+
+
+def detect_paths(search: str) -> List[str]:
+    """Пути HP API, которые инструменты агента вероятно запросят для этого вопроса"""
+    text = search.lower()
+    paths = []
+    for house, pattern in HOUSE_PATTERNS.items():
+        if pattern.search(text):
+            paths.append(f"/characters/house/{house}")
+    if CHARACTER_PATTERN.search(text) or CHARACTER_NAME_PATTERN.search(text):
+        paths.append("/characters")
+    if SPELL_PATTERN.search(text):
+        paths.append("/spells")
+    if STUDENT_PATTERN.search(text):
+        paths.append("/characters/students")
+    if STAFF_PATTERN.search(text):
+        paths.append("/characters/staff")
+    return paths
+
+
+class PrefetchStats:
+    """
+    Счётчики эффективности prefetch:
+    hit_rate - доля путей, которые prefetch реально загрузил из сети (а не нашёл
+    в кэше), и которые затем инструмент получил из кэша или дождался в полёте;
+    coverage - доля всех запросов инструментов к HP API, обслуженных таким прогревом,
+    включая запуски, где prefetch ничего не предсказал.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.predicted = 0
+        self.warmed = 0
+        self.hits = 0
+        self.tool_fetches = 0
+        self.tool_fetches_prefetched = 0
+
+    def record(
+        self,
+        paths: List[str],
+        warm_log: List[Tuple[str, str]],
+        tool_log: List[Tuple[str, str]]
+    ) -> None:
+        warmed = {path for path, source in warm_log if source == "network"}
+        served = [
+            path for path, source in tool_log
+            if path in warmed and source in ("cache", "inflight")
+        ]
+        self.runs += 1
+        self.predicted += len(set(paths))
+        self.warmed += len(warmed)
+        self.hits += len(set(served))
+        self.tool_fetches += len(tool_log)
+        self.tool_fetches_prefetched += len(served)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": PREFETCH_ENABLED,
+            "runs": self.runs,
+            "predicted": self.predicted,
+            "warmed": self.warmed,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.warmed if self.warmed else None,
+            "tool_fetches": self.tool_fetches,
+            "tool_fetches_prefetched": self.tool_fetches_prefetched,
+            "coverage": self.tool_fetches_prefetched / self.tool_fetches if self.tool_fetches else None,
+        }
+
+
+stats = PrefetchStats()
+
+# Прогрев может пережить запуск агента; держим ссылки, чтобы задачи не собрал GC
+_tasks = set()
+
+
+async def _warm(paths: List[str], warm_log: List[Tuple[str, str]]) -> None:
+    # Собственный журнал: запросы prefetch не должны попадать в журнал инструментов
+    hp_api.fetch_log.set(warm_log)
+    with span("prefetch", category="prefetch", paths=paths):
+        results = await asyncio.gather(
+            *(hp_api.get_json(path) for path in paths),
+            return_exceptions=True
+        )
+    for path, result in zip(paths, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Prefetch failed for {path}: {result}")
+
+
+@asynccontextmanager
+async def speculate(search: str):
+    """
+    Прогреть кэш HP API параллельно с первым вызовом модели.
+    Инструмент, запросивший тот же путь, получит данные из кэша
+    или дождётся уже идущего запроса вместо нового.
+    Запросы инструментов учитываются в метриках и когда прогревать нечего.
+    """
+    paths = detect_paths(search) if PREFETCH_ENABLED else []
+    warm_log: List[Tuple[str, str]] = []
+    if paths:
+        task = asyncio.create_task(_warm(paths, warm_log))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    tool_log: List[Tuple[str, str]] = []
+    token = hp_api.fetch_log.set(tool_log)
+    try:
+        yield
+    finally:
+        try:
+            hp_api.fetch_log.reset(token)
+        except ValueError:
+            # Генератор мог завершиться в другом контексте
+            hp_api.fetch_log.set(None)
+        stats.record(paths, warm_log, tool_log)
+        logger.debug(f"Prefetch {paths}: warm {warm_log}, tools {tool_log}")
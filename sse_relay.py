@@ -0,0 +1,129 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Префикс текстовой дельты в том порядке полей, в котором его отдаёт Anthropic API
+_TEXT_DELTA_MARKER = b'"delta":{"type":"text_delta","text":'
+_TEXT_DELTA_TAIL = b'}}'
+
+
+class SSEParser:
+    """
+    Инкрементальный парсер Server-Sent Events поверх сырых байтовых чанков.
+    Чанки могут резать строки и события в любом месте; незавершённый хвост
+    остаётся в буфере до следующего feed().
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event = b""
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[Tuple[bytes, bytes]]:
+        """Вернуть завершённые события как пары (event, data)"""
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line_end = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+            line = bytes(buffer[start:line_end])
+            start = end + 1
+
+            if not line:
+                if self._data:
+                    data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+                    events.append((self._event, data))
+                self._event = b""
+                self._data = []
+                continue
+            if line[0] == 0x3A:  # ":" - комментарий
+                continue
+
+            field, _, value = line.partition(b":")
+            if value[:1] == b" ":
+                value = value[1:]
+            if field == b"data":
+                self._data.append(value)
+            elif field == b"event":
+                self._event = value
+
+        if start:
+            del buffer[:start]
+        return events
+
+
+class AnthropicStreamError(Exception):
+    pass
+
+
+class AnthropicStreamRelay:
+    """
+    Разбор потока Anthropic Messages API с минимумом перекодирования:
+    текст дельт отдаётся готовым JSON-литералом строки прямо из ответа API,
+    остальные события (message_start, message_delta, error, ping) разбираются целиком
+    и копят usage и stop_reason для финального события.
+    """
+
+    def __init__(self):
+        self.parser = SSEParser()
+        self.usage: Dict[str, Any] = {}
+        self.stop_reason: Optional[str] = None
+        self.model: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Вернуть JSON-литералы текстовых дельт, завершённых в этом чанке"""
+        texts = []
+        for event, data in self.parser.feed(chunk):
+            if event == b"content_block_delta" or (not event and b'"content_block_delta"' in data):
+                text = self._text_delta(data)
+                if text is not None:
+                    texts.append(text)
+            elif event != b"ping":
+                self._handle(data)
+        return texts
+
+    def _text_delta(self, data: bytes) -> Optional[str]:
+        # Быстрый путь: вырезаем строку "text" без json.loads/json.dumps
+        marker = data.find(_TEXT_DELTA_MARKER)
+        if marker != -1 and data.endswith(_TEXT_DELTA_TAIL):
+            literal = data[marker + len(_TEXT_DELTA_MARKER):-len(_TEXT_DELTA_TAIL)]
+            # Внутри корректного JSON-литерала кавычки экранированы, поэтому '","'
+            # означает, что после text идут другие поля и быстрый путь неприменим
+            if (
+                len(literal) >= 2
+                and literal[:1] == b'"'
+                and literal[-1:] == b'"'
+                and b'","' not in literal
+            ):
+                return literal.decode("utf-8") if len(literal) > 2 else None
+
+        try:
+            delta = json.loads(data).get("delta", {})
+        except json.JSONDecodeError:
+            return None
+        text = delta.get("text")
+        return json.dumps(text, ensure_ascii=False) if text else None
+
+    def _handle(self, data: bytes) -> None:
+        try:
+            payload = json.loads(data)
+        except json.JSONDecodeError:
+            return
+
+        event_type = payload.get("type")
+        if event_type == "message_start":
+            message = payload.get("message", {})
+            self.model = message.get("model")
+            self.usage.update(message.get("usage") or {})
+        elif event_type == "message_delta":
+            self.stop_reason = payload.get("delta", {}).get("stop_reason") or self.stop_reason
+            self.usage.update(payload.get("usage") or {})
+        elif event_type == "error":
+            error = payload.get("error", {})
+            raise AnthropicStreamError(f"{error.get('type', 'error')}: {error.get('message', '')}")
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional, Tuple, Union
+
+from tracing import flush_current_trace, span
+
+logger = logging.getLogger(__name__)
+
+
+def format_event_id(thread_id: str, run_id: str, seq: int) -> str:
+    return f"{thread_id}:{run_id}:{seq}"
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, str, int]]:
+    """
+    Разобрать Last-Event-ID вида "<thread_id>:<run_id>:<seq>".
+    Возвращает None, если заголовок не похож на наш идентификатор.
+    """
+    parts = event_id.strip().rsplit(":", 2)
+    if len(parts) != 3:
+        return None
+    thread_id, run_id, seq = parts
+    if not thread_id or not run_id or not seq.isdigit():
+        return None
+    return thread_id, run_id, int(seq)
+
+
+def format_frame(data: Union[Dict[str, Any], str], event_id: Optional[str] = None) -> str:
+    """SSE-кадр; строка считается уже сериализованным JSON"""
+    if not isinstance(data, str):
+        with span("sse.serialize", category="serialization"):
+            data = json.dumps(data, ensure_ascii=False)
+    if event_id is None:
+        return f"data: {data}\n\n"
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+class StreamSession:
+    """
+    Одна генерация ответа (run) в рамках thread_id: ограниченный буфер готовых
+    SSE-кадров и фоновая задача, которая продолжает генерацию даже после обрыва клиента.
+    """
+
+    def __init__(self, thread_id: str, run_id: str, max_events: int):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.events: deque = deque(maxlen=max(1, max_events))
+        self.next_seq = 0
+        self.done = False
+        self.updated_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def append(self, data: Union[Dict[str, Any], str]) -> None:
+        """Добавить событие; строка считается уже сериализованным JSON"""
+        seq = self.next_seq
+        self.next_seq += 1
+        frame = format_frame(data, format_event_id(self.thread_id, self.run_id, seq))
+        self.events.append((seq, frame))
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self.updated_at = time.monotonic()
+        # Будим всех подписчиков и готовим новое событие для следующего ожидания
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def subscribe(self, last_seq: int = -1) -> AsyncGenerator[str, None]:
+        """Отдать кадры после last_seq, затем ждать новых до конца генерации"""
+        while True:
+            wakeup = self._wakeup
+            if last_seq + 1 < self.next_seq:
+                first_seq = self.events[0][0]
+                if last_seq + 1 < first_seq:
+                    # Часть ответа уже вытеснена из буфера: докачка дала бы обрезанный
+                    # ответ, поэтому сообщаем клиенту о пропуске и закрываем поток
+                    logger.warning(
+                        f"Replay gap for run {self.run_id}: "
+                        f"requested {last_seq + 1}, oldest buffered {first_seq}"
+                    )
+                    yield format_frame({
+                        "type": "gap",
+                        "thread_id": self.thread_id,
+                        "missed_from": last_seq + 1,
+                        "oldest_available": first_seq,
+                        "error": "Часть ответа больше недоступна, отправьте вопрос заново",
+                    })
+                    return
+                # Берём кадр по индексу без копии буфера: пока подписчик ждёт
+                # отправки, генерация дописывает deque и сдвигает его начало
+                seq, frame = self.events[last_seq + 1 - first_seq]
+                yield frame
+                last_seq = seq
+                continue
+            if self.done:
+                return
+            await wakeup.wait()
+
+
+class ReplayBuffer:
+    """
+    Реестр сессий стриминга по run_id: каждый вопрос в thread_id получает свою
+    сессию, поэтому докачка не смешивает ответы разных ходов диалога.
+    Завершённые и зависшие генерации вытесняются по TTL, общее число сессий ограничено.
+    """
+
+    def __init__(self, max_events: int = 2000, ttl: float = 300.0, max_sessions: int = 1000):
+        self.max_events = max_events
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, StreamSession]" = OrderedDict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [
+            run_id for run_id, session in self._sessions.items()
+            if now - session.updated_at > self.ttl
+        ]
+        for run_id in expired:
+            session = self._sessions.pop(run_id)
+            # Генерация без событий дольше TTL считается зависшей
+            if not session.done and session.task is not None:
+                logger.warning(f"Cancelling stalled generation for thread {session.thread_id}")
+                session.task.cancel()
+        while len(self._sessions) > self.max_sessions:
+            run_id, _ = self._sessions.popitem(last=False)
+            logger.debug(f"Replay session evicted: {run_id}")
+
+    def get(self, run_id: str) -> Optional[StreamSession]:
+        self._evict()
+        return self._sessions.get(run_id)
+
+    def start(self, thread_id: str, producer: AsyncIterator[Union[Dict[str, Any], str]]) -> StreamSession:
+        """Запустить генерацию в фоне; её события попадут в буфер сессии"""
+        self._evict()
+        session = StreamSession(thread_id, uuid.uuid4().hex[:12], self.max_events)
+        self._sessions[session.run_id] = session
+        session.task = asyncio.create_task(self._pump(session, producer))
+        return session
+
+    async def _pump(self, session: StreamSession, producer: AsyncIterator[Union[Dict[str, Any], str]]) -> None:
+        try:
+            async for data in producer:
+                session.append(data)
+        except Exception as e:
+            logger.error(f"Replay producer failed for thread {session.thread_id}: {e}")
+        finally:
+            session.finish()
+            flush_current_trace()
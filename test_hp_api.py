@@ -0,0 +1,101 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import hp_api
+
+
+class FakeResponse:
+    def __init__(self, url):
+        self.url = url
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"url": self.url}
+
+
+class FakeClient:
+    is_closed = False
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = []
+
+    async def get(self, url):
+        self.calls.append(url)
+        await asyncio.sleep(self.delay)
+        return FakeResponse(url)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(hp_api, "_client", fake)
+    monkeypatch.setattr(hp_api, "_cache", OrderedDict())
+    monkeypatch.setattr(hp_api, "_inflight", {})
+    return fake
+
+
+def test_cancelled_owner_does_not_cancel_joiners(client):
+    async def scenario():
+        owner = asyncio.create_task(hp_api.get_json("/characters"))
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(hp_api.get_json("/characters"))
+        await asyncio.sleep(0)
+        owner.cancel()
+        result = await joiner
+        return owner, result
+
+    owner, result = asyncio.run(scenario())
+    assert owner.cancelled()
+    assert result == {"url": f"{hp_api.HP_API_BASE_URL}/characters"}
+    assert len(client.calls) == 1
+    assert "/characters" in hp_api._cache
+    assert hp_api._inflight == {}
+
+
+def test_errors_reach_every_waiter(client, monkeypatch):
+    async def failing_get(url):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(client, "get", failing_get)
+
+    async def scenario():
+        return await asyncio.gather(
+            hp_api.get_json("/spells"),
+            hp_api.get_json("/spells"),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert "/spells" not in hp_api._cache
+
+
+def test_cache_is_bounded_lru(client, monkeypatch):
+    monkeypatch.setattr(hp_api, "HP_API_CACHE_MAX_ENTRIES", 2)
+
+    async def scenario():
+        await hp_api.get_json("/character/a")
+        await hp_api.get_json("/character/b")
+        await hp_api.get_json("/character/a")
+        await hp_api.get_json("/character/c")
+
+    asyncio.run(scenario())
+    assert list(hp_api._cache) == ["/character/a", "/character/c"]
+    assert len(client.calls) == 3
+
+
+def test_expired_entries_are_refetched(client, monkeypatch):
+    monkeypatch.setattr(hp_api, "HP_API_CACHE_TTL", 0.0)
+
+    async def scenario():
+        await hp_api.get_json("/spells")
+        await hp_api.get_json("/spells")
+
+    asyncio.run(scenario())
+    assert len(client.calls) == 2
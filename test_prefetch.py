@@ -0,0 +1,105 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import hp_api
+import prefetch
+
+
+class FakeResponse:
+    def __init__(self, url):
+        self.url = url
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return [{"name": "Hermione Granger", "alternate_names": [], "url": self.url}]
+
+
+class FakeClient:
+    is_closed = False
+
+    def __init__(self):
+        self.calls = []
+
+    async def get(self, url):
+        self.calls.append(url)
+        await asyncio.sleep(0.02)
+        return FakeResponse(url)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(hp_api, "_client", fake)
+    monkeypatch.setattr(hp_api, "_cache", OrderedDict())
+    monkeypatch.setattr(hp_api, "_inflight", {})
+    monkeypatch.setattr(prefetch, "stats", prefetch.PrefetchStats())
+    return fake
+
+
+async def agent_run(search, tool_path=None):
+    async with prefetch.speculate(search):
+        await asyncio.sleep(0.005)  # первый вызов модели
+        if tool_path:
+            await asyncio.create_task(hp_api.get_json(tool_path))
+
+
+def test_detect_paths():
+    assert prefetch.detect_paths("Кто такая Гермиона из Гриффиндора?") == [
+        "/characters/house/gryffindor", "/characters"
+    ]
+    assert prefetch.detect_paths("Привет!") == []
+    assert prefetch.detect_paths("Tell me about Ron Weasley") == ["/characters"]
+    assert prefetch.detect_paths("Что Рон подарил Луне?") == ["/characters"]
+    assert prefetch.detect_paths("Which spells did Harry Potter learn?") == ["/characters", "/spells"]
+
+
+def test_detect_paths_ignores_names_inside_other_words():
+    for search in [
+        "What is the strongest curse?",
+        "iron wand cores",
+        "front door of the castle",
+        "Какая сторона победила?",
+        "Расскажи о хронике войны",
+    ]:
+        assert prefetch.detect_paths(search) == [], search
+
+
+def test_tool_joins_inflight_prefetch(client):
+    asyncio.run(agent_run("Расскажи про Гермиону", "/characters"))
+
+    assert len(client.calls) == 1
+    snapshot = prefetch.stats.snapshot()
+    assert snapshot["warmed"] == 1
+    assert snapshot["hits"] == 1
+    assert snapshot["coverage"] == 1.0
+
+
+def test_warm_cache_is_not_counted_as_hit(client):
+    async def scenario():
+        await hp_api.get_json("/characters")
+        await agent_run("Расскажи про Гермиону", "/characters")
+
+    asyncio.run(scenario())
+
+    snapshot = prefetch.stats.snapshot()
+    assert snapshot["predicted"] == 1
+    assert snapshot["warmed"] == 0
+    assert snapshot["hit_rate"] is None
+    assert snapshot["coverage"] == 0.0
+
+
+def test_runs_without_prediction_count_towards_coverage(client):
+    async def scenario():
+        await agent_run("Расскажи про Гермиону", "/characters")
+        await agent_run("Что было дальше?", "/spells")
+
+    asyncio.run(scenario())
+
+    snapshot = prefetch.stats.snapshot()
+    assert snapshot["runs"] == 2
+    assert snapshot["tool_fetches"] == 2
+    assert snapshot["coverage"] == 0.5
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from sse_relay import AnthropicStreamError, AnthropicStreamRelay, SSEParser
+
+TEXTS = [
+    "Hello",
+    " wörld ✨ Гарри",
+    'escaped "quotes" and \\ backslash',
+    '","',
+    'ends with quote"',
+    "line\nbreak",
+]
+
+
+def sse_event(name, data, newline="\n"):
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {name}{newline}data: {payload}{newline}{newline}".encode("utf-8")
+
+
+def text_delta(text):
+    return {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+
+
+def build_stream(texts, newline="\n"):
+    events = [
+        ("message_start", {
+            "type": "message_start",
+            "message": {"id": "msg_1", "model": "claude-test", "usage": {"input_tokens": 12, "output_tokens": 1}},
+        }),
+        ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+        ("ping", {"type": "ping"}),
+    ]
+    events += [("content_block_delta", text_delta(text)) for text in texts]
+    events += [
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 42}}),
+        ("message_stop", {"type": "message_stop"}),
+    ]
+    return b"".join(sse_event(name, data, newline) for name, data in events)
+
+
+def relay_in_chunks(stream, size):
+    relay = AnthropicStreamRelay()
+    literals = []
+    for i in range(0, len(stream), size):
+        literals += relay.feed(stream[i:i + size])
+    return relay, [json.loads(literal) for literal in literals]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_relay_survives_arbitrary_chunk_splits(size):
+    relay, texts = relay_in_chunks(build_stream(TEXTS), size)
+    assert texts == TEXTS
+    assert relay.model == "claude-test"
+    assert relay.stop_reason == "end_turn"
+    assert relay.usage == {"input_tokens": 12, "output_tokens": 42}
+
+
+def test_parser_splits_inside_utf8_sequence():
+    data = "data: ✨\n\n".encode("utf-8")
+    split = data.index("✨".encode("utf-8")) + 1
+    parser = SSEParser()
+    assert parser.feed(data[:split]) == []
+    assert parser.feed(data[split:]) == [(b"", "✨".encode("utf-8"))]
+
+
+def test_relay_handles_crlf_line_endings():
+    relay, texts = relay_in_chunks(build_stream(TEXTS, newline="\r\n"), 5)
+    assert texts == TEXTS
+    assert relay.stop_reason == "end_turn"
+
+
+def test_parser_joins_multiline_data_and_skips_comments():
+    parser = SSEParser()
+    events = parser.feed(b": keep-alive\nevent: custom\ndata: a\ndata: b\n\ndata: c\n\n")
+    assert events == [(b"custom", b"a\nb"), (b"", b"c")]
+
+
+def test_fast_path_returns_upstream_literal_unchanged():
+    relay = AnthropicStreamRelay()
+    data = b'{"type":"content_block_delta","index":0,"delta":{"type":"text_delta","text":"caf\\u00e9"}}'
+    assert relay.feed(b"event: content_block_delta\ndata: " + data + b"\n\n") == ['"caf\\u00e9"']
+
+
+def test_extra_delta_fields_fall_back_to_json():
+    relay = AnthropicStreamRelay()
+    data = b'{"type":"content_block_delta","index":0,"delta":{"type":"text_delta","text":"a","extra":"b"}}'
+    assert relay.feed(b"event: content_block_delta\ndata: " + data + b"\n\n") == ['"a"']
+
+
+def test_non_text_deltas_and_empty_text_are_skipped():
+    relay = AnthropicStreamRelay()
+    stream = sse_event("content_block_delta", {
+        "type": "content_block_delta", "index": 1,
+        "delta": {"type": "input_json_delta", "partial_json": '{"name": "Harry'},
+    }) + sse_event("content_block_delta", text_delta(""))
+    assert relay.feed(stream) == []
+
+
+def test_events_without_event_field_are_detected_by_type():
+    relay = AnthropicStreamRelay()
+    data = json.dumps(text_delta("Hi"), separators=(",", ":")).encode("utf-8")
+    assert relay.feed(b"data: " + data + b"\n\n") == ['"Hi"']
+
+
+def test_error_event_raises():
+    relay = AnthropicStreamRelay()
+    assert relay.feed(sse_event("content_block_delta", text_delta("partial"))) == ['"partial"']
+    error = sse_event("error", {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+    with pytest.raises(AnthropicStreamError, match="overloaded_error: Overloaded"):
+        relay.feed(error)
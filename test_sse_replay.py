@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from sse_replay import ReplayBuffer, format_event_id, parse_event_id
+
+
+async def produce(count, delay=0.0, prefix="chunk"):
+    for i in range(count):
+        if delay:
+            await asyncio.sleep(delay)
+        yield {"content": f"{prefix}-{i}"}
+
+
+def parse_frames(frames):
+    parsed = []
+    for frame in frames:
+        event_id = None
+        for line in frame.strip().split("\n"):
+            if line.startswith("id: "):
+                event_id = line[4:]
+            elif line.startswith("data: "):
+                parsed.append((event_id, json.loads(line[6:])))
+    return parsed
+
+
+async def collect(session, last_seq=-1):
+    return [frame async for frame in session.subscribe(last_seq)]
+
+
+def test_event_id_round_trip():
+    event_id = format_event_id("thread:with:colons", "abc123", 7)
+    assert parse_event_id(event_id) == ("thread:with:colons", "abc123", 7)
+    assert parse_event_id("thread:7") is None
+    assert parse_event_id("thread:run:x") is None
+
+
+def test_resume_replays_only_missed_events():
+    async def scenario():
+        buffer = ReplayBuffer(max_events=100)
+        session = buffer.start("t", produce(5))
+        await session.task
+
+        resumed = buffer.get(session.run_id)
+        return parse_frames(await collect(resumed, 2))
+
+    events = asyncio.run(scenario())
+    assert [data["content"] for _, data in events] == ["chunk-3", "chunk-4"]
+    assert parse_event_id(events[0][0])[2] == 3
+
+
+def test_resume_attaches_to_running_generation():
+    async def scenario():
+        buffer = ReplayBuffer(max_events=100)
+        session = buffer.start("t", produce(10, delay=0.005))
+        first = []
+        async for frame in session.subscribe():
+            first.append(frame)
+            if len(first) == 3:
+                break  # клиент оборвал соединение
+
+        last_seq = parse_event_id(parse_frames(first)[-1][0])[2]
+        return parse_frames(await collect(buffer.get(session.run_id), last_seq))
+
+    events = asyncio.run(scenario())
+    assert [data["content"] for _, data in events] == [f"chunk-{i}" for i in range(3, 10)]
+
+
+def test_runs_on_same_thread_do_not_mix():
+    async def scenario():
+        buffer = ReplayBuffer(max_events=100)
+        first = buffer.start("t", produce(10, prefix="turn1"))
+        await first.task
+        second = buffer.start("t", produce(20, prefix="turn2"))
+        await second.task
+        return parse_frames(await collect(buffer.get(first.run_id), 3))
+
+    events = asyncio.run(scenario())
+    assert [data["content"] for _, data in events] == [f"turn1-{i}" for i in range(4, 10)]
+
+
+def test_gap_is_reported_instead_of_truncated_replay():
+    async def scenario():
+        buffer = ReplayBuffer(max_events=3)
+        session = buffer.start("t", produce(10))
+        await session.task
+        return parse_frames(await collect(session, 1))
+
+    events = asyncio.run(scenario())
+    assert len(events) == 1
+    event_id, data = events[0]
+    assert event_id is None
+    assert data["type"] == "gap"
+    assert data["missed_from"] == 2
+    assert data["oldest_available"] == 7
+
+
+def test_slow_subscriber_reads_while_generation_appends():
+    async def scenario():
+        buffer = ReplayBuffer(max_events=100)
+        session = buffer.start("t", produce(10, delay=0.001))
+        frames = []
+        async for frame in session.subscribe():
+            frames.append(frame)
+            await asyncio.sleep(0.003)  # медленная отправка клиенту
+        return parse_frames(frames)
+
+    events = asyncio.run(scenario())
+    assert [data["content"] for _, data in events] == [f"chunk-{i}" for i in range(10)]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def written(monkeypatch):
+    events = []
+    monkeypatch.setattr(tracing.writer, "write", events.extend)
+    return events
+
+
+def spans_by_id(events):
+    return {event["args"]["span_id"]: event for event in events if event["ph"] == "X"}
+
+
+def contains(outer, inner):
+    return outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def assert_tracks_nest(spans):
+    # На одной дорожке "X"-события либо не пересекаются, либо вложены
+    for a in spans:
+        for b in spans:
+            if a is b or a["tid"] != b["tid"]:
+                continue
+            disjoint = a["ts"] + a["dur"] <= b["ts"] or b["ts"] + b["dur"] <= a["ts"]
+            assert disjoint or contains(a, b) or contains(b, a), (a, b)
+
+
+def test_concurrent_spans_nest_per_task(written):
+    async def worker(name, delay):
+        with tracing.span(name):
+            await asyncio.sleep(delay)
+            with tracing.span(f"{name}.inner"):
+                await asyncio.sleep(delay)
+
+    async def scenario():
+        trace = tracing.Trace("GET /chat/stream")
+        token = tracing._current_trace.set(trace)
+        try:
+            with tracing.span("request"):
+                prefetch = asyncio.create_task(worker("prefetch", 0.01))
+                # tools стартует до конца prefetch и заканчивается после него
+                await asyncio.sleep(0.015)
+                await worker("tools", 0.01)
+                await prefetch
+        finally:
+            tracing._current_trace.reset(token)
+            trace.close()
+
+    asyncio.run(scenario())
+
+    spans = spans_by_id(written)
+    by_name = {event["name"]: event for event in spans.values()}
+    assert set(by_name) == {"request", "prefetch", "prefetch.inner", "tools", "tools.inner"}
+    assert_tracks_nest(list(spans.values()))
+
+    # Параллельные ветки на разных дорожках, последовательные - на дорожке родителя
+    assert by_name["prefetch"]["tid"] != by_name["request"]["tid"]
+    assert by_name["tools"]["tid"] == by_name["request"]["tid"]
+    assert by_name["prefetch.inner"]["tid"] == by_name["prefetch"]["tid"]
+
+    for event in spans.values():
+        parent_id = event["args"]["parent_id"]
+        if parent_id is not None:
+            assert contains(spans[parent_id], event)
+
+    names = {event["tid"]: event["args"]["name"] for event in written if event["ph"] == "M"}
+    assert set(names) == {event["tid"] for event in spans.values()}
+
+
+def test_span_without_trace_records_nothing(written):
+    with tracing.span("idle"):
+        pass
+    assert written == []
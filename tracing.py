@@ -0,0 +1,404 @@
+import asyncio
+import atexit
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+# Трейсинг выключен по умолчанию: TRACE_ENABLED=true и доля сэмплирования запросов
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/trace.json")
+TRACE_FLUSH_BATCH = int(os.getenv("TRACE_FLUSH_BATCH", "256"))
+
+
+def _now_us() -> int:
+    return time.perf_counter_ns() // 1000
+
+
+class TraceWriter:
+    """
+    Пишет события в формате Chrome Trace Event (JSON Array Format):
+    файл открывается в chrome://tracing или ui.perfetto.dev.
+    Закрывающая скобка массива в этом формате необязательна, поэтому
+    события можно дописывать в конец файла по мере завершения запросов.
+    Запись идёт в фоновом потоке, event loop только кладёт пачки в очередь.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.SimpleQueue[Optional[List[Dict[str, Any]]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def write(self, events: List[Dict[str, Any]]) -> None:
+        if not events:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.put(events)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        f = None
+        try:
+            while True:
+                batch = self._queue.get()
+                stop = batch is None
+                batches = [] if stop else [batch]
+                # Забираем всё накопившееся, чтобы писать одним заходом
+                while not stop:
+                    try:
+                        batch = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if batch is None:
+                        stop = True
+                    else:
+                        batches.append(batch)
+
+                if batches:
+                    try:
+                        if f is None:
+                            f = self._open()
+                        for events in batches:
+                            for event in events:
+                                f.write(json.dumps(event, ensure_ascii=False, default=str))
+                                f.write(",\n")
+                        f.flush()
+                    except OSError as e:
+                        logger.error(f"Failed to write trace file {self.path}: {e}")
+                if stop:
+                    return
+        finally:
+            if f is not None:
+                f.close()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        f = open(self.path, "a", encoding="utf-8")
+        if new_file:
+            f.write("[\n")
+        return f
+
+
+writer = TraceWriter(TRACE_FILE)
+_trace_ids = itertools.count(1)
+_track_ids = itertools.count(1)
+
+
+class Trace:
+    """
+    Спаны одного запроса; сбрасываются в файл при закрытии корневого спана.
+    Каждая asyncio-задача пишет на свою дорожку (tid): "X"-события одной дорожки
+    должны строго вкладываться друг в друга, а prefetch и узлы агента идут параллельно.
+    Связь между дорожками сохраняется в args.parent_id.
+    Фоновая генерация может пережить HTTP-запрос: такие спаны копятся
+    и уходят пачками по TRACE_FLUSH_BATCH или по flush() в конце генерации.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.id = next(_trace_ids)
+        self._span_ids = itertools.count(1)
+        self._tracks: Dict[Any, int] = {}
+        self._events: List[Dict[str, Any]] = []
+        self._closed = False
+
+    def new_span_id(self) -> str:
+        return f"{self.id}.{next(self._span_ids)}"
+
+    def track(self) -> int:
+        """Дорожка текущей asyncio-задачи (или потока, если event loop не запущен)"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = task if task is not None else threading.get_ident()
+        tid = self._tracks.get(key)
+        if tid is None:
+            tid = self._tracks[key] = next(_track_ids)
+            label = self.name
+            if len(self._tracks) > 1:
+                label += f" [{task.get_name() if task is not None else 'thread'}]"
+            self._events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": label},
+            })
+        return tid
+
+    def record(
+        self,
+        name: str,
+        category: str,
+        start_us: int,
+        end_us: int,
+        span_id: str,
+        parent_id: Optional[str],
+        args: Optional[Dict[str, Any]] = None,
+        tid: Optional[int] = None
+    ) -> None:
+        self._events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_us,
+            "dur": max(end_us - start_us, 0),
+            "pid": os.getpid(),
+            "tid": tid if tid is not None else self.track(),
+            "args": {"span_id": span_id, "parent_id": parent_id, **(args or {})},
+        })
+        if self._closed and len(self._events) >= TRACE_FLUSH_BATCH:
+            self.flush()
+
+    def flush(self) -> None:
+        events, self._events = self._events, []
+        writer.write(events)
+
+    def close(self) -> None:
+        self._closed = True
+        self.flush()
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def flush_current_trace() -> None:
+    """Сбросить спаны, накопленные после закрытия HTTP-запроса"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.flush()
+
+
+@contextmanager
+def span(name: str, category: str = "app", **args: Any):
+    """Записать спан вложенным в текущий; без активного трейса ничего не делает"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    parent_id = _current_span.get()
+    span_id = trace.new_span_id()
+    # Дорожку берём при открытии: генератор может закрыть спан из другой задачи
+    tid = trace.track()
+    token = _current_span.set(span_id)
+    start = _now_us()
+    try:
+        yield
+    finally:
+        end = _now_us()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Генератор мог завершиться в другом контексте
+            _current_span.set(parent_id)
+        trace.record(name, category, start, end, span_id, parent_id, args, tid)
+
+
+class TracingMiddleware:
+    """Корневой ASGI middleware: сэмплирует запрос и открывает для него трейс"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not TRACE_ENABLED
+            or scope["type"] != "http"
+            or random.random() >= TRACE_SAMPLE_RATE
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        trace_token = _current_trace.set(trace)
+        try:
+            with span(trace.name, category="http", path=scope["path"]):
+                await self.app(scope, receive, send)
+        finally:
+            _current_trace.reset(trace_token)
+            trace.close()
+
+
+class TracedMiddleware:
+    """Оборачивает произвольный middleware в спан с заданным именем"""
+
+    def __init__(self, app, middleware, name: str, **options):
+        self.inner = middleware(app, **options)
+        self.name = name
+
+    async def __call__(self, scope, receive, send):
+        if _current_trace.get() is None:
+            await self.inner(scope, receive, send)
+            return
+        with span(self.name, category="middleware"):
+            await self.inner(scope, receive, send)
+
+
+class _TracingCallbacks:
+    """
+    Спаны для узлов LangGraph, вызовов модели и инструментов.
+    Вложенность берётся из parent_run_id, служебные runnable пропускаются.
+    """
+
+    run_inline = True
+
+    def __init__(self, trace: Trace, root_span_id: Optional[str]):
+        self.trace = trace
+        self.root_span_id = root_span_id
+        self._parents: Dict[UUID, Optional[str]] = {}
+        self._open: Dict[UUID, tuple] = {}
+
+    def _parent_of(self, parent_run_id: Optional[UUID]) -> Optional[str]:
+        if parent_run_id is None:
+            return self.root_span_id
+        if parent_run_id in self._open:
+            return self._open[parent_run_id][0]
+        return self._parents.get(parent_run_id, self.root_span_id)
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        name: str,
+        category: str,
+        record: bool = True
+    ) -> None:
+        parent_id = self._parent_of(parent_run_id)
+        if record:
+            self._open[run_id] = (
+                self.trace.new_span_id(), parent_id, name, category, self.trace.track(), _now_us()
+            )
+        else:
+            self._parents[run_id] = parent_id
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        self._parents.pop(run_id, None)
+        opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        span_id, parent_id, name, category, tid, start = opened
+        args = {"error": repr(error)} if error is not None else None
+        self.trace.record(name, category, start, _now_us(), span_id, parent_id, args, tid)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        is_node = (metadata or {}).get("langgraph_node") == name
+        self._start(run_id, parent_run_id, name, "langgraph", record=parent_run_id is None or is_node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, f"tool.{name}", "tool")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", "llm")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+@lru_cache(maxsize=None)
+def _callback_handler_class():
+    # langchain_core нужен только agent-режиму, lite-развёртывания его не импортируют
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    return type("TracingCallbackHandler", (_TracingCallbacks, BaseCallbackHandler), {})
+
+
+def langchain_callbacks() -> List[Any]:
+    """Callback-и для config агента; пустой список, если запрос не сэмплирован"""
+    trace = _current_trace.get()
+    if trace is None:
+        return []
+    return [_callback_handler_class()(trace, _current_span.get())]
+
+
+_profile_lock = asyncio.Lock()
+
+
+async def profile_cpu(seconds: float, limit: int = 50) -> str:
+    """
+    Снять CPU-профиль воркера за указанное время.
+    Профилируется поток event loop, то есть все запросы, обработанные за это время.
+    Полный профиль сохраняется рядом с трейсом для snakeviz/pstats.
+    """
+    if _profile_lock.locked():
+        raise RuntimeError("Profiling is already in progress")
+
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+    directory = os.path.dirname(TRACE_FILE) or "."
+    path = os.path.join(directory, f"profile-{int(time.time())}.prof")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(path)
+    except OSError as e:
+        logger.error(f"Failed to save profile {path}: {e}")
+        path = None
+
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    header = f"Profile saved to {path}\n\n" if path else ""
+    return header + output.getvalue()